@@ -1,3 +1,5 @@
+import functools
+import os
 import numpy as np
 import sys
 import math
@@ -33,19 +35,10 @@ class BlockEncoder(ChannelEncoder):
     will be a numpy array of integers (each integer is 0 or 1).
     '''
     def encode(self, A, bits):
-        k, m = A.shape
-        k_N = bits.shape[0]
-        N = k_N//k
-        bits = bits.reshape((N,k))
-        #create identity matrix
-        I = np.identity(k)
-        G = np.concatenate((I,A), axis=1)
-        new_arr =  np.matmul(bits,G)
-        modu = lambda t: t%2
-        vfunc = np.vectorize(modu)
-        temp_result_array = vfunc(new_arr)
-        result_array = temp_result_array.ravel()
-        return result_array
+        return linear_block_code(A).encode(bits)
+
+    def encode_stream(self, A, chunks, batch_blocks=4096):
+        return linear_block_code(A).encode_stream(chunks, batch_blocks)
 
 def syndrome_dictionary_maker(H):
     #we will consider m+k+1 different type of vectors shifting exactly one 1 and one vector will be of all zeros
@@ -87,31 +80,221 @@ class SyndromeDecoder(ChannelDecoder):
     '''
 
     def decode(self, A, bits):
-        k, m = A.shape
-        A_T = np.transpose(A)
-        I_m = np.identity(m)
-        H = np.concatenate((A_T,I_m),axis=1)
-        k_N = bits.shape[0]
-        N = k_N//(k+m)
-        bits = bits.reshape((N,k+m))
-        res = np.matmul(H,np.transpose(bits))
-        res_T = np.transpose(res)
-        modu = lambda t: t%2
-        vfunc = np.vectorize(modu)
-        res_T = vfunc(res_T)
-        res_T_list = res_T.tolist()
-        final_result_list = bits[:,:k]
-        syndrome_dictionary = syndrome_dictionary_maker(H)
-        for i in range(len(res_T_list)):
-            l_np = np.array(res_T_list[i])
-            n = l_np.shape[0]
-            l_np = l_np.reshape((n,1))
-            if not np.array_equal(l_np,np.zeros((n,1))):
-                col_num = syndrome_dictionary[tuple(map(tuple,l_np))]
-                if col_num<=k-1:
-                    final_result_list[i,col_num] = flip(final_result_list[i,col_num])
-        
-        return final_result_list.ravel()
+        return linear_block_code(A).decode(bits)
+
+    def decode_stream(self, A, chunks, n_bits=None, batch_blocks=4096):
+        return linear_block_code(A).decode_stream(chunks, n_bits, batch_blocks)
+
+'''
+A systematic linear block code with k data bits and m parity bits,
+G = [I | A] and H = [A^T | I], with everything the encoder and the
+syndrome decoder need precomputed from A:
+
+  G, H          read-only uint8 matrices
+  data_columns  the codeword columns holding the data bits
+  table         the coset-leader table: 2**m entries indexed by the
+                syndrome read as an m-bit integer (first syndrome bit
+                in the high position).  table[s] is a minimum-weight
+                error pattern with syndrome s, packed into an unsigned
+                integer with bit j set if codeword column j is in
+                error.
+
+The coset-leader table covers every syndrome, so decoding corrects
+every error pattern of weight up to the code's correction power (and
+some heavier ones) and never fails.  Building it takes O(n 2**m)
+time; for large m pass table_path, and the table is written there (in
+.npy format, at exactly that path, whatever its extension) the first
+time and memory-mapped from there afterwards.
+
+Use linear_block_code(A) rather than constructing one directly, so
+that repeated calls with the same A share one instance.
+'''
+class LinearBlockCode():
+
+    def __init__(self, A, table_path=None):
+        A = np.asarray(A, dtype=np.uint8) % 2
+        self.k, self.m = A.shape
+        self.n = self.k + self.m
+        if self.n > 64:
+            raise ValueError("codewords longer than 64 bits are not supported")
+        self.G = np.concatenate((np.identity(self.k, dtype=np.uint8), A), axis=1)
+        self.H = np.concatenate((A.T, np.identity(self.m, dtype=np.uint8)), axis=1)
+        self.data_columns = np.arange(self.k)
+        self.syndrome_weights = 1 << np.arange(self.m-1, -1, -1)
+        self.pattern_dtype = np.uint32 if self.n <= 32 else np.uint64
+
+        # column_syndromes[j] is the syndrome of an error in column j.
+        self.column_syndromes = self.H.T.astype(np.int64).dot(self.syndrome_weights)
+        self.data_shifts = self.data_columns.astype(self.pattern_dtype)
+
+        if table_path is not None and os.path.exists(table_path):
+            self.table = self.load_table(table_path)
+        else:
+            self.table = self.coset_leaders()
+            if table_path is not None:
+                # Through a file object, so that np.save does not add
+                # .npy to the path.
+                with open(table_path, 'wb') as f:
+                    np.save(f, self.table)
 
+        for array in (self.G, self.H, self.data_columns, self.syndrome_weights,
+                      self.column_syndromes, self.data_shifts, self.table):
+            if array.flags.writeable:
+                array.setflags(write=False)
 
+    '''
+    Builds the coset-leader table by a breadth-first search over
+    syndromes: the error patterns of weight w+1 are those of weight w
+    with one more column flipped, and each syndrome keeps the first
+    pattern that reaches it.  Every level is processed with vectorized
+    XORs, one column at a time, lowest column first.
+    '''
+    def coset_leaders(self):
+        leaders = np.zeros(2**self.m, dtype=self.pattern_dtype)
+        covered = np.zeros(2**self.m, dtype=bool)
+        covered[0] = True
+        frontier_syndromes = np.zeros(1, dtype=np.int64)
+        frontier_patterns = np.zeros(1, dtype=self.pattern_dtype)
+        while len(frontier_syndromes) and not covered.all():
+            next_syndromes, next_patterns = [], []
+            for j in range(self.n):
+                syndromes = frontier_syndromes ^ self.column_syndromes[j]
+                new = ~covered[syndromes]
+                syndromes = syndromes[new]
+                patterns = frontier_patterns[new] | self.pattern_dtype(1 << j)
+                covered[syndromes] = True
+                leaders[syndromes] = patterns
+                next_syndromes.append(syndromes)
+                next_patterns.append(patterns)
+            frontier_syndromes = np.concatenate(next_syndromes)
+            frontier_patterns = np.concatenate(next_patterns)
+        return leaders
+
+    '''
+    Memory-maps a table written by an earlier LinearBlockCode for the
+    same A, after checking its size and a sample of its entries.
+    '''
+    def load_table(self, table_path):
+        table = np.load(table_path, mmap_mode='r')
+        if table.shape != (2**self.m,) or table.dtype != self.pattern_dtype:
+            raise ValueError("%s is not a coset-leader table for this code" % table_path)
+        sample = np.arange(0, 2**self.m, max(2**self.m // 4096, 1))
+        bits = (table[sample][:, np.newaxis] >> np.arange(self.n, dtype=self.pattern_dtype)) & 1
+        if not np.array_equal(self.syndromes(bits.astype(np.uint8))[1], sample):
+            raise ValueError("%s is not a coset-leader table for this code" % table_path)
+        return table
 
+    '''
+    Each codeword is the k message bits followed by the m parity bits
+    (message row) A mod 2.  The parity bits are an integer matmul on
+    uint8 followed by & 1: uint8 sums wrap modulo 256, which leaves
+    their low bit intact.
+    '''
+    def encode(self, bits):
+        N = bits.shape[0]//self.k
+        bits = np.asarray(bits, dtype=np.uint8).reshape((N,self.k))
+        codewords = np.empty((N,self.n), dtype=np.uint8)
+        codewords[:,:self.k] = bits
+        np.matmul(bits, self.G[:,self.k:], out=codewords[:,self.k:])
+        codewords[:,self.k:] &= 1
+        return codewords.ravel()
+
+    '''
+    Syndromes of an (N, n) array of codewords, in one matrix product,
+    as an (N, m) bit array and as the corresponding table indices.
+    '''
+    def syndromes(self, codewords):
+        syndromes = np.matmul(codewords, self.H.T) & 1
+        return syndromes, syndromes.dot(self.syndrome_weights)
+
+    def decode(self, bits):
+        N = bits.shape[0]//self.n
+        bits = np.asarray(bits, dtype=np.uint8).reshape((N,self.n))
+        errors = self.table[self.syndromes(bits)[1]]
+        # Only the data bits of the coset leader matter; errors in the
+        # parity bits need no correction.
+        data = bits[:,self.data_columns]
+        data ^= ((errors[:,np.newaxis] >> self.data_shifts) & 1).astype(np.uint8)
+        return data.ravel()
+
+    '''
+    Streaming encoder.  chunks is an iterable of bit chunks (see
+    as_bits), e.g. from iter_file_bits; the encoded bits are yielded
+    batch_blocks codewords at a time, so memory use does not depend on
+    the length of the message.  If the message does not fill the last
+    block, that block is padded with zeros; pass the message length to
+    decode_stream to drop the padding again.
+    '''
+    def encode_stream(self, chunks, batch_blocks=4096):
+        for batch in rebatch(chunks, batch_blocks*self.k):
+            if len(batch) % self.k:
+                batch = np.concatenate((batch, np.zeros(self.k - len(batch) % self.k, dtype=np.uint8)))
+            yield self.encode(batch)
+
+    '''
+    Streaming decoder, the counterpart of encode_stream.  If n_bits is
+    given, only the first n_bits decoded bits are yielded.
+    '''
+    def decode_stream(self, chunks, n_bits=None, batch_blocks=4096):
+        for batch in rebatch(chunks, batch_blocks*self.n):
+            if len(batch) % self.n:
+                raise ValueError("stream ends with a partial codeword of %d bits" % (len(batch) % self.n))
+            data = self.decode(batch)
+            if n_bits is not None:
+                data = data[:n_bits]
+                n_bits -= len(data)
+            yield data
+
+@functools.lru_cache(maxsize=32)
+def _cached_linear_block_code(shape, data, table_path):
+    return LinearBlockCode(np.frombuffer(data, dtype=np.uint8).reshape(shape), table_path)
+
+'''
+The LinearBlockCode for A, built on first use and then kept in an LRU
+cache keyed on A.tobytes() (and table_path, see LinearBlockCode).
+'''
+def linear_block_code(A, table_path=None):
+    A = np.ascontiguousarray(A, dtype=np.uint8)
+    return _cached_linear_block_code(A.shape, A.tobytes(), table_path)
+
+'''
+Converts one chunk of a stream to a uint8 array of bits: bytes-like
+chunks are unpacked, most significant bit first, and anything else is
+taken to be a sequence of 0s and 1s already.
+'''
+def as_bits(chunk):
+    if isinstance(chunk, (bytes, bytearray, memoryview)):
+        return np.unpackbits(np.frombuffer(chunk, dtype=np.uint8))
+    return np.asarray(chunk, dtype=np.uint8)
+
+'''
+Regroups a stream of chunks (see as_bits) into bit arrays of exactly
+size bits, except for the last one, which holds whatever is left over.
+'''
+def rebatch(chunks, size):
+    pending = []
+    n_pending = 0
+    for chunk in chunks:
+        bits = as_bits(chunk)
+        pending.append(bits)
+        n_pending += len(bits)
+        if n_pending >= size:
+            bits = np.concatenate(pending)
+            n_full = len(bits) - len(bits) % size
+            for i in range(0, n_full, size):
+                yield bits[i:i+size]
+            pending = [bits[n_full:]]
+            n_pending = len(pending[0])
+    if n_pending:
+        yield np.concatenate(pending)
+
+'''
+Yields the bits of a file chunk_bytes bytes at a time, reading it
+through a memory map rather than into memory all at once.
+'''
+def iter_file_bits(path, chunk_bytes=1<<20):
+    if os.path.getsize(path) == 0:
+        return
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    for i in range(0, len(data), chunk_bytes):
+        yield np.unpackbits(data[i:i+chunk_bytes])
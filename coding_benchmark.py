@@ -0,0 +1,157 @@
+import argparse
+import csv
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+from viterbi import ConvolutionalEncoder, ViterbiDecoder, BENCHMARK_CODES, generator_matrix, get_trellis
+from LBC_Syndrome_decoder import BlockEncoder, SyndromeDecoder, linear_block_code
+
+# Benchmark harness for the channel coding stack: convolutional codes
+# (ConvolutionalEncoder / ViterbiDecoder) and linear block codes
+# (BlockEncoder / SyndromeDecoder).  Every case sends a random message
+# through the encoder, an AWGN channel (bits are sent as voltages 0
+# and 1) and the decoder, and records encode and decode throughput,
+# peak memory and bit error rate.  All randomness comes from a seeded
+# RNG, so runs are repeatable and can be compared across releases.
+
+FIELDS = ['code', 'params', 'n_bits', 'noise', 'encode_bits_per_sec', 'decode_bits_per_sec',
+          'encode_peak_bytes', 'decode_peak_bytes', 'ber']
+
+# Parity matrix A (k x m) of a single-error-correcting block code: the
+# rows are distinct m-bit vectors of weight at least 2, so the columns
+# of H = [A^T | I] are distinct and nonzero.  k = 2**m - m - 1 gives
+# the Hamming code.
+def block_parity_matrix(k, m):
+    rows = [[(v >> (m-1-i)) & 1 for i in range(m)] for v in range(2**m) if bin(v).count('1') >= 2]
+    if k > len(rows):
+        raise ValueError("no single-error-correcting code with k=%d, m=%d" % (k, m))
+    return numpy.array(rows[:k])
+
+# Runs f() and returns its result and the elapsed time in seconds.
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - start
+
+# Runs f() under tracemalloc and returns the peak memory it allocated,
+# in bytes.  Kept separate from timed() since tracing slows the code
+# down.
+def peak_memory(f):
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def awgn(bits, noise, rng):
+    return bits + rng.normal(0, noise, len(bits))
+
+def convolutional_case(K, n_bits, noise, metric, rng):
+    G = generator_matrix(K, BENCHMARK_CODES[K])
+    encoder = ConvolutionalEncoder(G)
+    decoder = ViterbiDecoder(G)
+    message = rng.randint(0, 2, n_bits)
+    # Build (and cache) the trellis before timing anything.
+    get_trellis(G)
+
+    sent, encode_time = timed(lambda: encoder.encode(message))
+    received = awgn(sent, noise, rng)
+    decoded, decode_time = timed(lambda: decoder.decode(received, metric))
+
+    return {
+        'code': 'convolutional',
+        'params': 'K=%d,metric=%s' % (K, metric),
+        'n_bits': n_bits,
+        'noise': noise,
+        'encode_bits_per_sec': n_bits / encode_time,
+        'decode_bits_per_sec': n_bits / decode_time,
+        'encode_peak_bytes': peak_memory(lambda: encoder.encode(message)),
+        'decode_peak_bytes': peak_memory(lambda: decoder.decode(received, metric)),
+        'ber': float(numpy.mean(decoded != message)),
+    }
+
+def block_case(k, m, n_bits, noise, rng):
+    A = block_parity_matrix(k, m)
+    encoder = BlockEncoder()
+    decoder = SyndromeDecoder()
+    n_bits -= n_bits % k
+    message = rng.randint(0, 2, n_bits)
+    # Build (and cache) the code and its syndrome table before timing
+    # anything.
+    linear_block_code(A)
+
+    sent, encode_time = timed(lambda: encoder.encode(A, message))
+    received = (awgn(sent, noise, rng) > 0.5).astype(int)
+    decoded, decode_time = timed(lambda: decoder.decode(A, received.copy()))
+
+    return {
+        'code': 'block',
+        'params': 'k=%d,m=%d' % (k, m),
+        'n_bits': n_bits,
+        'noise': noise,
+        'encode_bits_per_sec': n_bits / encode_time,
+        'decode_bits_per_sec': n_bits / decode_time,
+        'encode_peak_bytes': peak_memory(lambda: encoder.encode(A, message)),
+        'decode_peak_bytes': peak_memory(lambda: decoder.decode(A, received.copy())),
+        'ber': float(numpy.mean(decoded != message)),
+    }
+
+# Runs every combination of message length, code and noise level and
+# returns one record (a dict with the keys in FIELDS) per case.
+def run(lengths, constraint_lengths, block_shapes, noise_levels, metric='hard', seed=0):
+    rng = numpy.random.RandomState(seed)
+    results = []
+    for n_bits in lengths:
+        for noise in noise_levels:
+            for K in constraint_lengths:
+                results.append(convolutional_case(K, n_bits, noise, metric, rng))
+            for k, m in block_shapes:
+                results.append(block_case(k, m, n_bits, noise, rng))
+    return results
+
+def write_json(results, f):
+    json.dump(results, f, indent=2)
+    f.write('\n')
+
+def write_csv(results, f):
+    writer = csv.DictWriter(f, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(results)
+
+def parse_shape(text):
+    k, m = text.split(',')
+    return int(k), int(m)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--lengths', type=int, nargs='+', default=[10000, 100000], help='message lengths in bits')
+    parser.add_argument('-K', '--constraint-lengths', type=int, nargs='+', default=[3, 5, 7], help='convolutional code constraint lengths')
+    parser.add_argument('-b', '--block-shapes', type=parse_shape, nargs='+', default=[(4, 3), (11, 4), (26, 5)], help='block code shapes, as k,m')
+    parser.add_argument('--noise', type=float, nargs='+', default=[0.0, 0.2, 0.3], help='AWGN standard deviations')
+    parser.add_argument('--metric', default='hard', help='Viterbi branch metric')
+    parser.add_argument('--seed', type=int, default=0, help='RNG seed')
+    parser.add_argument('--json', type=str, help='write results as JSON to this file ("-" for stdout)')
+    parser.add_argument('--csv', type=str, help='write results as CSV to this file ("-" for stdout)')
+    args = parser.parse_args()
+
+    results = run(args.lengths, args.constraint_lengths, args.block_shapes, args.noise, args.metric, args.seed)
+
+    for filename, writer in ((args.json, write_json), (args.csv, write_csv)):
+        if filename == '-':
+            writer(results, sys.stdout)
+        elif filename is not None:
+            with open(filename, 'w', newline='') as f:
+                writer(results, f)
+
+    if args.json is None and args.csv is None:
+        for r in results:
+            print("%-13s %-20s n=%-8d noise=%.2f  encode %10.0f b/s  decode %10.0f b/s  peak %9d B  BER %.2e" % (
+                r['code'], r['params'], r['n_bits'], r['noise'], r['encode_bits_per_sec'],
+                r['decode_bits_per_sec'], r['decode_peak_bytes'], r['ber']))
@@ -1,6 +1,14 @@
+import argparse
+import collections
+import heapq
+import itertools
+import random
+import struct
 import sys
+import time
+
+import numpy
 
-from collections import defaultdict
 from bitstring import BitString
 
 if (sys.version_info[0] != 3):
@@ -28,35 +36,60 @@ class HuffmanTree:
     # build_tree(), self.root should be set to point to a HuffmanNode
     # representing the root of a Huffman tree corresponding to the
     # symbols and probabilities given in self.source
+    #
+    # We keep merging the two nodes with the smallest probabilities
+    # into a node with probability equal to their sum, until only the
+    # root is left.  Ties go to the node created first (leaves in the
+    # order of self.source, then internal nodes in order of creation),
+    # so the same source always gives the same tree.  The candidates
+    # are kept in a heap, which makes the build O(n log n); if the
+    # probabilities already arrive in increasing order, the two-queue
+    # method builds the same tree in O(n).
     def build_tree(self):
+        leaves = [HuffmanNode(element, self.source[element]) for element in self.source]
+        if all(leaves[i].probability <= leaves[i+1].probability for i in range(len(leaves)-1)):
+            self.root = self.build_tree_sorted(leaves)
+        else:
+            self.root = self.build_tree_heap(leaves)
+
+    @staticmethod
+    def build_tree_heap(leaves):
+        # Heap entries are (probability, creation order, node).
+        heap = [(node.probability, i, node) for i, node in enumerate(leaves)]
+        heapq.heapify(heap)
+        count = len(heap)
+        while len(heap) > 1:
+            min1 = heapq.heappop(heap)[2]
+            min2 = heapq.heappop(heap)[2]
+            new_node = HuffmanNode(symbol=None, probability=min1.probability+min2.probability)
+            new_node.left_child = min1
+            new_node.right_child = min2
+            heapq.heappush(heap, (new_node.probability, count, new_node))
+            count += 1
+        return heap[0][2]
+
+    # Two-queue construction for leaves sorted by probability.  Merged
+    # nodes are created in nondecreasing order of probability, so the
+    # smallest remaining node is always at the front of one of the two
+    # queues.
+    @staticmethod
+    def build_tree_sorted(leaves):
+        leaf_queue = collections.deque(leaves)
+        merged_queue = collections.deque()
 
-        # TODO: Your code here.  You're also free to add additional
-        # data structures in __init__, if you wish.
-
-        # At the end, self.root should be set to a HuffmanNode that
-        # represents the root of the Huffman tree.
-        #
-        # self.root = 
-        # At first, for all symbols in source, we create a huffman node.
-        # we will keep removing the nodes with two smallest probabilities and a node with probability equal
-        # to their sum and keep doing it until we have only one node which will be the root
-        # Thoughts on ds, for efficiency we can take a sorted list of probabilities 
-        node_dict = {}
-        for element in self.source:
-            node = HuffmanNode(element,self.source[element])
-            node_dict[node]=self.source[element]
-        while len(node_dict)>1:
-            min1 = min(node_dict, key= node_dict.get)
-            del node_dict[min1]
-            min2 = min(node_dict, key= node_dict.get)
-            del node_dict[min2]
-            new_prob = min1.probability+min2.probability
-            new_node = HuffmanNode(symbol=None,probability = new_prob)
+        def pop_min():
+            if not merged_queue or (leaf_queue and leaf_queue[0].probability <= merged_queue[0].probability):
+                return leaf_queue.popleft()
+            return merged_queue.popleft()
+
+        while len(leaf_queue) + len(merged_queue) > 1:
+            min1 = pop_min()
+            min2 = pop_min()
+            new_node = HuffmanNode(symbol=None, probability=min1.probability+min2.probability)
             new_node.left_child = min1
-            new_node.right_child = min2 
-            node_dict[new_node] = new_prob
-        root_node = min(node_dict,key=node_dict.get)
-        self.root = root_node
+            new_node.right_child = min2
+            merged_queue.append(new_node)
+        return (leaf_queue or merged_queue)[0]
 
     # encode() returns a string of 0's and 1's representing the binary
     # encoding of message.
@@ -69,11 +102,49 @@ class HuffmanTree:
             print("Codebook: ", self.codebook)
         return s
 
+    # Bit-packed alternatives to encode(): both return (data, n_bits),
+    # the encoding packed most significant bit first into a bytearray,
+    # with the last byte padded with 0's.  encode_array() takes a numpy
+    # array of symbols and is vectorized.  See CanonicalCode.
+    def encode_packed(self, message):
+        return self.code.encode_packed(message)
+
+    def encode_array(self, message):
+        return self.code.encode_array(message)
+
+    # Decodes the output of encode_packed() or encode_array() back into
+    # a list of symbols.  See HuffmanDecoder.
+    def decode(self, data, n_bits):
+        return HuffmanDecoder(self.code).decode(data, n_bits)
+
     # Creates the codebook for this tree, which maps symbols to binary
-    # strings.  HuffmanNode.walk() does the real work here.
+    # strings.  Only the code lengths are taken from the tree; the
+    # codes themselves are the canonical ones for those lengths (see
+    # CanonicalCode), so the codebook can be rebuilt from a header
+    # holding just the lengths.  self.code holds the codebook as
+    # integer code and length arrays.
     def set_codebook(self):
-        self.codebook = self.root.walk()
-                
+        self.code = CanonicalCode(list(self.source), self.code_lengths())
+        self.codebook = self.code.codebook()
+
+    # Depth of every leaf of the tree, listed in the order of
+    # self.source.  The tree is walked with an explicit stack, so deep
+    # (skewed) trees do not hit the recursion limit.
+    def code_lengths(self):
+        depth = {}
+        stack = [(self.root, 0)]
+        while stack:
+            node, d = stack.pop()
+            if node.left_child is None and node.right_child is None:
+                # A lone root still needs a one-bit code.
+                depth[node.symbol] = max(d, 1)
+            else:
+                if node.right_child is not None:
+                    stack.append((node.right_child, d+1))
+                if node.left_child is not None:
+                    stack.append((node.left_child, d+1))
+        return [depth[symbol] for symbol in self.source]
+
 
 class HuffmanNode:
 
@@ -158,3 +229,562 @@ class HuffmanNode:
     # "less than" method, for sorting trees
     def __lt__(self, other):
         return self.probability < other.probability
+
+
+# A canonical prefix code: the code of every symbol is determined by
+# the code lengths alone.  Symbols are ordered by (code length,
+# position in symbols), and each gets the next integer code of its
+# length, so codes of the same length are consecutive and shorter
+# codes come first.  A decoder that knows the symbol alphabet only
+# needs the lengths.
+#
+# self.codes[i] and self.lengths[i] are the code of symbols[i], as an
+# integer, and its length in bits.  Codes are uint64 when they all fit
+# in 64 bits (self.max_length <= 64), and Python ints otherwise.
+class CanonicalCode:
+
+    def __init__(self, symbols, lengths):
+        self.symbols = list(symbols)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.lengths = numpy.array(lengths, dtype=numpy.uint16)
+        self.max_length = int(self.lengths.max()) if len(lengths) else 0
+
+        # Count the codes of each length, find the first code of each
+        # length, then hand out codes in symbol order -- all in one
+        # pass over the symbols after the counting.
+        max_length = self.max_length
+        count = [0] * (max_length + 1)
+        for l in lengths:
+            count[l] += 1
+        next_code = [0] * (max_length + 1)
+        code = 0
+        for l in range(1, max_length + 1):
+            code = (code + count[l-1]) << 1
+            next_code[l] = code
+        codes = []
+        for l in lengths:
+            codes.append(next_code[l])
+            next_code[l] += 1
+        self.codes = numpy.array(codes, dtype=numpy.uint64 if max_length <= 64 else object)
+
+    # symbol -> string of 0's and 1's
+    def codebook(self):
+        return {symbol: format(code, '0%db' % l) if l else ''
+                for symbol, code, l in zip(self.symbols, self.codes.tolist(), self.lengths.tolist())}
+
+    # The header is all a decoder needs besides the alphabet: the number
+    # of symbols as a 4-byte big-endian integer, the number of bytes
+    # per length (1, or 2 for codes over 255 bits), then the code
+    # length of each symbol, in the order of self.symbols.
+    def header(self):
+        width = 1 if self.max_length <= 255 else 2
+        lengths = self.lengths.astype('>u%d' % width)
+        return struct.pack('>IB', len(self.lengths), width) + lengths.tobytes()
+
+    # Reads a header written by header() from data, starting at
+    # offset.  Returns the code lengths and the offset just past the
+    # header.
+    @staticmethod
+    def read_header(data, offset=0):
+        n, width = struct.unpack_from('>IB', data, offset)
+        offset += 5
+        lengths = numpy.frombuffer(data, dtype='>u%d' % width, count=n, offset=offset)
+        return lengths.astype(int).tolist(), offset + n*width
+
+    @classmethod
+    def from_header(cls, symbols, data, offset=0):
+        lengths, offset = cls.read_header(data, offset)
+        return cls(symbols, lengths)
+
+    # Encodes message (an iterable of symbols) through a BitWriter in
+    # one streaming pass, PACKED_BLOCK symbols at a time, so that only
+    # the packed output grows with the length of the message.  Returns
+    # (data, n_bits).
+    PACKED_BLOCK = 1 << 12
+
+    def encode_packed(self, message):
+        table = {symbol: (code, l) for symbol, code, l in zip(self.symbols, self.codes.tolist(), self.lengths.tolist())}
+        writer = BitWriter()
+        message = iter(message)
+        while True:
+            block = [table[m] for m in itertools.islice(message, self.PACKED_BLOCK)]
+            if not block:
+                return writer.getvalue()
+            codes, lengths = zip(*block)
+            writer.write_codes(codes, lengths)
+
+    # Vectorized encode_packed for a numpy array of symbols.  The
+    # message is encoded in blocks of ARRAY_BLOCK symbols: each
+    # symbol's row of self.bit_rows() is gathered, the rows are cut to
+    # the code lengths, and the resulting bits are packed into bytes
+    # (bits that do not fill a byte carry over into the next block).
+    # Symbols are looked up a block at a time too, so the temporaries
+    # stay the size of one block.
+    ARRAY_BLOCK = 1 << 16
+
+    def encode_array(self, message):
+        message = numpy.asarray(message).ravel()
+        if self.max_length > 64:
+            return self.encode_packed(message.tolist())
+        B = self.ARRAY_BLOCK
+        return self.pack_blocks(self.symbol_indices(message[start:start+B]) for start in range(0, len(message), B))
+
+    # Same as encode_array, for symbols given by their positions in
+    # self.symbols.
+    def encode_indices(self, index):
+        if self.max_length > 64:
+            return self.encode_packed([self.symbols[i] for i in index.tolist()])
+        B = self.ARRAY_BLOCK
+        return self.pack_blocks(index[start:start+B] for start in range(0, len(index), B))
+
+    def pack_blocks(self, blocks):
+        rows, mask = self.bit_rows()
+        data = bytearray()
+        carry = numpy.zeros(0, dtype=numpy.uint8)
+        for block in blocks:
+            bits = numpy.concatenate((carry, rows[block][mask[block]]))
+            n = len(bits) & ~7
+            data += numpy.packbits(bits[:n]).tobytes()
+            carry = bits[n:]
+        n_bits = len(data)*8 + len(carry)
+        data += numpy.packbits(carry).tobytes()
+        return data, n_bits
+
+    # Positions in self.symbols of a numpy array of symbols.  Small
+    # non-negative integer alphabets go through a dense lookup array;
+    # anything else through numpy.unique and self.index.
+    def symbol_indices(self, message):
+        if message.dtype.kind in 'iu' and len(message):
+            lut = self.integer_lookup()
+            if lut is not None and message.min() >= 0 and message.max() < len(lut):
+                index = lut[message]
+                if (index < 0).any():
+                    raise KeyError(message[numpy.flatnonzero(index < 0)[0]].item())
+                return index
+        values, inverse = numpy.unique(message, return_inverse=True)
+        return numpy.array([self.index[v] for v in values.tolist()], dtype=numpy.intp)[inverse.ravel()]
+
+    def integer_lookup(self):
+        if not hasattr(self, '_integer_lookup'):
+            self._integer_lookup = None
+            if all(type(symbol) is int and 0 <= symbol < 1 << 24 for symbol in self.symbols):
+                lut = numpy.full(max(self.symbols) + 1, -1, dtype=numpy.intp)
+                lut[self.symbols] = numpy.arange(len(self.symbols))
+                self._integer_lookup = lut
+        return self._integer_lookup
+
+    # rows[i] holds the code of symbols[i] as max_length uint8 bits,
+    # left-aligned, and mask[i] is True over its first lengths[i]
+    # entries.  Built on first use; len(symbols) * max_length bytes
+    # each.
+    def bit_rows(self):
+        if not hasattr(self, '_bit_rows'):
+            L = self.max_length
+            shifts = self.lengths.astype(numpy.int64)[:, numpy.newaxis] - 1 - numpy.arange(L)
+            mask = shifts >= 0
+            rows = (self.codes[:, numpy.newaxis] >> numpy.maximum(shifts, 0).astype(numpy.uint64)) & numpy.uint64(1)
+            self._bit_rows = (rows.astype(numpy.uint8) * mask, mask)
+        return self._bit_rows
+
+
+# Accumulates variable-length codes and packs them, most significant
+# bit first, into a bytearray.  Codes are gathered in an integer
+# accumulator and written out a whole number of bytes at a time.  If
+# capacity_bits is given, the bytearray is allocated up front.
+class BitWriter:
+
+    def __init__(self, capacity_bits=0):
+        self.data = bytearray((capacity_bits + 7) // 8)
+        self.n_bytes = 0     # bytes of self.data written so far
+        self.acc = 0         # bits not yet written, in the low n_acc bits
+        self.n_acc = 0
+
+    def write(self, code, length):
+        self.write_codes((code,), (length,))
+
+    def write_codes(self, codes, lengths):
+        data, n_bytes, acc, n_acc = self.data, self.n_bytes, self.acc, self.n_acc
+        for code, length in zip(codes, lengths):
+            acc = (acc << length) | code
+            n_acc += length
+            if n_acc >= 64:
+                n = n_acc >> 3
+                n_acc &= 7
+                data[n_bytes:n_bytes+n] = (acc >> n_acc).to_bytes(n, 'big')
+                n_bytes += n
+                acc &= (1 << n_acc) - 1
+        self.n_bytes, self.acc, self.n_acc = n_bytes, acc, n_acc
+
+    # Number of bits written so far.
+    def __len__(self):
+        return self.n_bytes*8 + self.n_acc
+
+    # Returns (data, n_bits) with everything written so far, the last
+    # byte padded with 0's.
+    def getvalue(self):
+        n_bits = len(self)
+        n = (self.n_acc + 7) >> 3
+        tail = (self.acc << (n*8 - self.n_acc)).to_bytes(n, 'big')
+        data = self.data[:self.n_bytes] + tail
+        return data, n_bits
+
+
+# Table-driven decoder for a CanonicalCode, working on packed bytes
+# (most significant bit first, as written by BitWriter).
+#
+# The first level is a table indexed by the next table_bits input
+# bits: for every code of at most table_bits bits, all entries that
+# start with that code hold its symbol and length.  Longer codes fall
+# through to a second level that uses the canonical structure: the
+# codes of length l are the consecutive integers starting at
+# first_code[l], so an l-bit window w is a code iff
+# first_code[l] <= w < first_code[l] + count[l].
+#
+# Decoding is done a block of BLOCK_BITS input bits at a time.  Both
+# levels are evaluated with numpy at every bit position of the block
+# at once, which gives the symbol and length of the code that would
+# start there; a single pass then hops from one code start to the
+# next.  Codes longer than 64 bits do not fit numpy integers, so for
+# those the second level is walked bit by bit with Python ints
+# instead (see decode_long).
+class HuffmanDecoder:
+
+    BLOCK_BITS = 1 << 20
+
+    def __init__(self, code, table_bits=None):
+        self.code = code
+        self.max_length = code.max_length
+        if self.max_length > 64:
+            self.init_long()
+            return
+        if table_bits is None:
+            table_bits = min(self.max_length, 12)
+        if not 1 <= table_bits <= 16:
+            raise ValueError("table_bits must be between 1 and 16")
+        self.table_bits = table_bits
+
+        lengths = code.lengths.astype(numpy.int64)
+        codes = code.codes.astype(numpy.uint64)
+
+        # First level: table_symbol[w], table_length[w] for every
+        # table_bits-bit window w; table_length is 0 where the window
+        # is the prefix of a longer code.
+        T = table_bits
+        self.table_symbol = numpy.zeros(2**T, dtype=numpy.int64)
+        self.table_length = numpy.zeros(2**T, dtype=numpy.int64)
+        for i in numpy.flatnonzero(lengths <= T):
+            start = int(codes[i]) << (T - int(lengths[i]))
+            stop = start + (1 << (T - int(lengths[i])))
+            self.table_symbol[start:stop] = i
+            self.table_length[start:stop] = lengths[i]
+
+        # Second level: first_code[l], count[l], and the symbols of
+        # each length in code order, starting at first_index[l] in
+        # by_code.
+        by_code = numpy.lexsort((numpy.arange(len(lengths)), lengths))
+        self.by_code = by_code
+        self.first_code = numpy.zeros(self.max_length + 1, dtype=numpy.uint64)
+        self.count = numpy.zeros(self.max_length + 1, dtype=numpy.uint64)
+        self.first_index = numpy.zeros(self.max_length + 1, dtype=numpy.int64)
+        for l in range(1, self.max_length + 1):
+            of_length = by_code[lengths[by_code] == l]
+            self.count[l] = len(of_length)
+            if len(of_length):
+                self.first_code[l] = codes[of_length[0]]
+                self.first_index[l] = numpy.searchsorted(lengths[by_code], l)
+
+    # Second level alone, as Python lists, for codes over 64 bits.
+    def init_long(self):
+        lengths = self.code.lengths.tolist()
+        codes = self.code.codes.tolist()
+        self.by_code = sorted(range(len(lengths)), key=lambda i: (lengths[i], i))
+        self.first_code = [0] * (self.max_length + 1)
+        self.count = [0] * (self.max_length + 1)
+        self.first_index = [0] * (self.max_length + 1)
+        for position, i in enumerate(self.by_code):
+            l = lengths[i]
+            if not self.count[l]:
+                self.first_code[l] = codes[i]
+                self.first_index[l] = position
+            self.count[l] += 1
+
+    # Decodes the first n_bits bits of data one bit at a time, using
+    # the tables from init_long.
+    def decode_long(self, data, n_bits):
+        bits = numpy.unpackbits(numpy.frombuffer(bytes(data), dtype=numpy.uint8))[:n_bits].tolist()
+        if len(bits) < n_bits:
+            raise ValueError("last code runs past the end of the data")
+        first_code, count, first_index, by_code = self.first_code, self.count, self.first_index, self.by_code
+        decoded = []
+        window = 0
+        l = 0
+        for bit in bits:
+            window = (window << 1) | bit
+            l += 1
+            offset = window - first_code[l]
+            if count[l] and 0 <= offset < count[l]:
+                decoded.append(by_code[first_index[l] + offset])
+                window = 0
+                l = 0
+            elif l == self.max_length:
+                raise ValueError("invalid code in input")
+        if l:
+            raise ValueError("last code runs past the end of the data")
+        return numpy.array(decoded, dtype=numpy.int64)
+
+    # Symbol index (into code.symbols) and length of the code starting
+    # at each of the first n bit positions of chunk, a uint8 array
+    # that must extend at least max_length bits (and 3 bytes) further.
+    # Length 0 means no code starts there.
+    def codes_at(self, chunk, n):
+        T = self.table_bits
+        # The first-level window at bit p is cut out of the 24 bits
+        # starting at byte p // 8, for all eight bit offsets at once.
+        n_bytes = (n + 7) // 8
+        triples = (chunk[:n_bytes].astype(numpy.int32) << 16) | (chunk[1:n_bytes+1].astype(numpy.int32) << 8) | chunk[2:n_bytes+2]
+        shifts = 24 - T - numpy.arange(8)
+        window = ((triples[:, numpy.newaxis] >> shifts) & ((1 << T) - 1)).ravel()[:n]
+        symbol = self.table_symbol[window]
+        length = self.table_length[window]
+
+        long_codes = numpy.flatnonzero(length == 0)
+        if len(long_codes) and self.max_length > T:
+            bits = numpy.unpackbits(chunk)
+            window = window[long_codes].astype(numpy.uint64)
+            for l in range(T + 1, self.max_length + 1):
+                window = (window << numpy.uint64(1)) | bits[long_codes + (l-1)]
+                if not self.count[l]:
+                    continue
+                offset = window - self.first_code[l]
+                found = (window >= self.first_code[l]) & (offset < self.count[l]) & (length[long_codes] == 0)
+                hits = long_codes[found]
+                symbol[hits] = self.by_code[self.first_index[l] + offset[found].astype(numpy.int64)]
+                length[hits] = l
+        return symbol, length
+
+    # Hops along the chain of code starts from position p, given the
+    # code length at each of the first n positions, and returns the
+    # starts below n and the first position at or past n.  nxt maps
+    # every position to the next code start, with positions from n on
+    # mapped to themselves and invalid codes to a sink.  Composing nxt
+    # with itself HOP_LOG times gives a map that skips 2**HOP_LOG codes
+    # at once, so the Python loop only visits every 2**HOP_LOG-th
+    # start; the ones in between are filled in with numpy.
+    HOP_LOG = 3
+
+    def code_starts(self, length, n, p):
+        sink = n + self.max_length
+        nxt = numpy.arange(sink + 1)
+        nxt[:n] += length
+        nxt[:n][length == 0] = sink
+        hop = nxt
+        for k in range(self.HOP_LOG):
+            hop = hop[hop]
+
+        group_starts = []
+        while p < n:
+            group_starts.append(p)
+            p = hop.item(p)
+        if p == sink:
+            raise ValueError("invalid code in input")
+
+        starts = numpy.empty((2**self.HOP_LOG, len(group_starts)), dtype=numpy.int64)
+        starts[0] = group_starts
+        for k in range(1, 2**self.HOP_LOG):
+            starts[k] = nxt[starts[k-1]]
+        starts = starts.T.ravel()
+        return starts[starts < n], p
+
+    # Decodes the first n_bits bits of data into an array of symbol
+    # indices (positions in code.symbols).
+    def decode_indices(self, data, n_bits):
+        if self.max_length > 64:
+            return self.decode_long(data, n_bits)
+        data = numpy.frombuffer(bytes(data), dtype=numpy.uint8)
+        # Blocks start on byte boundaries.
+        B = max(self.BLOCK_BITS // 8, 1) * 8
+        decoded = []
+        p = 0
+        for start in range(0, n_bits, B):
+            stop = min(start + B, n_bits)
+            # Bytes of the block plus enough lookahead for the longest
+            # code, zero-padded past the end of the data.
+            need = (stop - start + self.max_length + 7) // 8 + 3
+            chunk = data[start//8:start//8 + need]
+            if len(chunk) < need:
+                chunk = numpy.concatenate((chunk, numpy.zeros(need - len(chunk), dtype=numpy.uint8)))
+            symbol, length = self.codes_at(chunk, stop - start)
+            starts, q = self.code_starts(length, stop - start, p - start)
+            decoded.append(symbol[starts])
+            p = start + q
+        if p != n_bits and n_bits:
+            raise ValueError("last code runs past the end of the data")
+        if not decoded:
+            return numpy.zeros(0, dtype=numpy.int64)
+        return numpy.concatenate(decoded)
+
+    def decode(self, data, n_bits):
+        symbols = self.code.symbols
+        return [symbols[i] for i in self.decode_indices(data, n_bits).tolist()]
+
+
+# Adaptive (single-pass) Huffman coding over a known alphabet.  The
+# encoder and the decoder each keep running counts of the symbols seen
+# so far, starting at 1 so that every symbol always has a code, and
+# rebuild the same canonical code from them whenever the encoder calls
+# for a refresh -- no code lengths are ever sent.  Counts are halved
+# once their total passes max_count, which bounds their size and lets
+# the code follow a drifting source.
+#
+# The stream is a sequence of frames, each holding at most
+# frame_symbols symbols:
+#
+#   flags      1 byte, bit 0 set if both sides rebuild the code from
+#              their counts before this frame
+#   n_symbols  4-byte big-endian integer
+#   n_bits     4-byte big-endian integer
+#   payload    the symbols encoded with the current code, padded to a
+#              whole number of bytes
+#
+# The encoder asks for a refresh once refresh_symbols symbols have
+# been coded since the last one.  The decoder only needs the same
+# alphabet and max_count.
+class AdaptiveHuffmanModel:
+
+    FRAME_HEADER = struct.Struct('>BII')
+    REFRESH = 1
+
+    def __init__(self, alphabet, max_count=1 << 20):
+        self.alphabet = list(alphabet)
+        self.max_count = max_count
+        self.counts = numpy.ones(len(self.alphabet), dtype=numpy.int64)
+        self.since_refresh = 0
+        self.refresh()
+
+    # Rebuilds the code (and its decoder, built on first use) from the
+    # current counts.
+    def refresh(self):
+        tree = HuffmanTree(dict(zip(self.alphabet, self.counts.tolist())))
+        self.code = tree.code
+        self._decoder = None
+        self.since_refresh = 0
+
+    def decoder(self):
+        if self._decoder is None:
+            self._decoder = HuffmanDecoder(self.code)
+        return self._decoder
+
+    # Adds the symbols at positions index of the alphabet to the counts.
+    def update(self, index):
+        self.counts += numpy.bincount(index, minlength=len(self.counts))
+        self.since_refresh += len(index)
+        if self.counts.sum() > self.max_count:
+            self.counts = (self.counts + 1) // 2
+
+
+class AdaptiveHuffmanEncoder(AdaptiveHuffmanModel):
+
+    def __init__(self, alphabet, refresh_symbols=4096, frame_symbols=None, max_count=1 << 20):
+        super(AdaptiveHuffmanEncoder, self).__init__(alphabet, max_count)
+        self.refresh_symbols = refresh_symbols
+        self.frame_symbols = frame_symbols or refresh_symbols
+
+    # Encodes a chunk of symbols (any iterable, or a numpy array) as it
+    # arrives and returns the frames for it as bytes.  Only numpy
+    # arrays take the vectorized lookup; other iterables go through
+    # self.code.index symbol by symbol, so tuples, mixed types and
+    # strings stay whole symbols.
+    def encode_chunk(self, symbols):
+        if isinstance(symbols, numpy.ndarray):
+            index = self.code.symbol_indices(symbols.ravel())
+        else:
+            lookup = self.code.index
+            index = numpy.fromiter((lookup[m] for m in symbols), dtype=numpy.intp)
+        frames = bytearray()
+        for start in range(0, len(index), self.frame_symbols):
+            block = index[start:start+self.frame_symbols]
+            flags = 0
+            if self.since_refresh >= self.refresh_symbols:
+                self.refresh()
+                flags |= self.REFRESH
+            data, n_bits = self.code.encode_indices(block)
+            frames += self.FRAME_HEADER.pack(flags, len(block), n_bits) + data
+            self.update(block)
+        return bytes(frames)
+
+    # Encodes an iterable of symbol chunks, yielding the frames for each.
+    def encode_stream(self, chunks):
+        for chunk in chunks:
+            yield self.encode_chunk(chunk)
+
+
+class AdaptiveHuffmanDecoder(AdaptiveHuffmanModel):
+
+    def __init__(self, alphabet, max_count=1 << 20):
+        super(AdaptiveHuffmanDecoder, self).__init__(alphabet, max_count)
+        self.pending = bytearray()
+
+    # Decodes as many whole frames as data (together with anything left
+    # over from earlier calls) holds, and returns their symbols as a
+    # list.  Incomplete frames are kept for the next call.
+    def decode_chunk(self, data):
+        self.pending += data
+        header = self.FRAME_HEADER
+        decoded = []
+        offset = 0
+        while len(self.pending) - offset >= header.size:
+            flags, n_symbols, n_bits = header.unpack_from(self.pending, offset)
+            end = offset + header.size + (n_bits + 7) // 8
+            if end > len(self.pending):
+                break
+            if flags & self.REFRESH:
+                self.refresh()
+            index = self.decoder().decode_indices(self.pending[offset + header.size:end], n_bits)
+            if len(index) != n_symbols:
+                raise ValueError("frame holds %d symbols, expected %d" % (len(index), n_symbols))
+            symbols = self.code.symbols
+            decoded.extend(symbols[i] for i in index.tolist())
+            self.update(index)
+            offset = end
+        del self.pending[:offset]
+        return decoded
+
+    # Decodes an iterable of byte chunks (frame boundaries need not line
+    # up with chunk boundaries), yielding the symbols of each.
+    def decode_stream(self, chunks):
+        for chunk in chunks:
+            yield self.decode_chunk(chunk)
+        if self.pending:
+            raise ValueError("stream ends with a partial frame")
+
+
+# Times build_tree() on random sources of each size; with
+# presorted=True the probabilities are given in increasing order, so
+# the two-queue method is used.
+def benchmark(sizes, presorted=False, seed=0):
+    rng = random.Random(seed)
+    results = []
+    for n in sizes:
+        weights = [rng.random() for i in range(n)]
+        if presorted:
+            weights.sort()
+        total = sum(weights)
+        source = {i: w/total for i, w in enumerate(weights)}
+        # Skip __init__, which would also build the codebook.
+        tree = HuffmanTree.__new__(HuffmanTree)
+        tree.source = source
+        start = time.perf_counter()
+        tree.build_tree()
+        results.append((n, time.perf_counter() - start))
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--sizes', type=int, nargs='+', default=[10**3, 10**4, 10**5, 10**6], help='alphabet sizes')
+    parser.add_argument('--sorted', action='store_true', help='give probabilities in increasing order')
+    args = parser.parse_args()
+
+    for n, elapsed in benchmark(args.sizes, args.sorted):
+        print("%8d symbols: tree built in %.3f s" % (n, elapsed))
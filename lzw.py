@@ -1,6 +1,9 @@
 import argparse
-import array
+import multiprocessing
+import random
+import struct
 import sys
+import time
 
 if (sys.version_info[0] != 3):
     print("You must use Python 3 -- Exiting")
@@ -13,89 +16,473 @@ class LZW():
     def __init__(self, word_size=16):
         self.word_size = word_size
 
-    def encode(self, message):
+    # The dictionary maps (prefix code, next byte) pairs, packed into
+    # the integer prefix_code << 8 | byte, to codes; codes 0-255 are
+    # the single bytes and are not stored.  next_code is the code the
+    # next new entry gets.  When the last code (2**16-1) has been
+    # handed out, the dictionary starts over from the single bytes.
+    #
+    # encode_chunks() takes the message as an iterable of chunks (see
+    # as_bytes) and yields the list of codes completed by each chunk,
+    # carrying the dictionary and the pending prefix code from one
+    # chunk to the next; the last list holds the final code.
+    def encode_chunks(self, chunks):
+        table = {}
+        get = table.get
+        next_code = 256
+        last_code = 2**16-1
+        code = None
+        for chunk in chunks:
+            data = memoryview(as_bytes(chunk))
+            if not len(data):
+                continue
+            if code is None:
+                code = data[0]
+                data = data[1:]
+            output = []
+            append = output.append
+            for byte in data:
+                key = code << 8 | byte
+                extended = get(key)
+                if extended is not None:
+                    code = extended
+                    continue
+                append(code)
+                if next_code > last_code:
+                    table.clear()
+                    next_code = 256
+                else:
+                    table[key] = next_code
+                    next_code += 1
+                code = byte
+            yield output
+        if code is not None:
+            yield [code]
 
+    def encode_codes(self, message):
         output = []
-        main_dictionary = {}
-        for i in range(256):
-            main_dictionary[chr(i)]=i
-        string = message[0]
-        curr_index = 0
-        l = len(message)
-        while curr_index<l-1:
-            symbol = message[curr_index+1]
-            if string+symbol in main_dictionary:
-                string+=symbol
-            else:
-                output.append(main_dictionary[string])
-                max_key = max(main_dictionary,key = main_dictionary.get)
-                max_val = main_dictionary[max_key]
-                if max_val==2**16-1:
-                    main_dictionary = {}
-                    for i in range(256):
-                        main_dictionary[chr(i)]=i
-                    #main_dictionary[string+symbol]=0
-                else:
-                    main_dictionary[string+symbol]=max_val+1
-                string = symbol
-            curr_index+=1
-        output.append(main_dictionary[string])
+        for codes in self.encode_chunks([message]):
+            output += codes
+        return output
+
+    def encode(self, message):
+        output = self.encode_codes(message)
         bits = BitString()
         bits.pack_numbers(output,16)
         return bits
 
-    def decode(self, bits):
-        # TODO: Your code here
+    # The decoder's table is a list indexed by code, preallocated to
+    # all 2**16 codes, holding the bytes each code stands for.  It
+    # grows (and restarts) exactly as the encoder's dictionary: reading
+    # a code tells us the entry the encoder added when it emitted the
+    # previous one, prev + the first byte of this code's string -- or,
+    # if that was the last code, that the encoder started over.
+    #
+    # decode_chunks() takes an iterable of code sequences and yields
+    # the decoded bytes of each.
+    def decode_chunks(self, chunks):
+        last_code = 2**16-1
+        table = [bytes((i,)) for i in range(256)] + [None] * (last_code + 1 - 256)
+        next_code = 256
+        prev = None
+        for numbers in chunks:
+            output = bytearray()
+            for code in numbers:
+                if code < 0:
+                    raise ValueError("invalid code %d" % code)
+                if prev is None or next_code > last_code:
+                    # The first code, and the first after a restart, is
+                    # always a single byte.
+                    if code >= 256:
+                        raise ValueError("invalid code %d" % code)
+                    if prev is not None:
+                        next_code = 256
+                    entry = table[code]
+                else:
+                    if code < next_code:
+                        entry = table[code]
+                    elif code == next_code:
+                        entry = prev + prev[:1]
+                    else:
+                        raise ValueError("invalid code %d" % code)
+                    table[next_code] = prev + entry[:1]
+                    next_code += 1
+                output += entry
+                prev = entry
+            yield bytes(output)
+
+    def decode_codes(self, numbers):
+        return b''.join(self.decode_chunks([numbers]))
 
-        # You will need to change this return statement to return a meaningful string
+    # Returns the decoded message as a str, one character per byte.
+    def decode(self, bits):
         numbers = bits.unpack_all_numbers(16)
-        output_string = ''
-        decode_dict = {}
-        for i in range(256):
-            decode_dict[i]=chr(i)
-        string = decode_dict[numbers[0]]
-        curr_index = 0
-        output_string+=string
-        l = len(numbers)
-        while curr_index<l-1 :
-            code = numbers[curr_index+1]
-            if code not in decode_dict:
-                entry = string + string[0]
-            else:
-                entry = decode_dict[code]
-            output_string+=entry
-            max_key = max(list(decode_dict.keys()))
-            decode_dict[max_key+1]= string+entry[0]
-            string = entry
-            curr_index+=1
-        return output_string
+        return self.decode_codes(numbers).decode('latin-1')
+
+    # Byte-level streaming format, in the style of Unix compress: one
+    # byte holding word_size, then variable-width codes packed most
+    # significant bit first, the last byte padded with 0's.  Codes
+    # 256 (CLEAR) and 257 (EOI) are reserved, so dictionary entries
+    # start at 258.  Each code is written with just enough bits for
+    # the largest code in use when it is written -- 9 bits at first,
+    # one more each time the dictionary crosses a power of two, up to
+    # word_size.
+    #
+    # Once the dictionary is full it stops growing, and every
+    # CHECK_BYTES input bytes the encoder compares the compression
+    # ratio since the last CLEAR with the best ratio seen so far.  When
+    # it drops -- or when the last CHECK_BYTES came out larger than
+    # they went in, which catches a dictionary filled from data that
+    # did not compress at all -- it writes CLEAR and both sides start
+    # over from the single bytes.  The stream ends with EOI.
+    #
+    # encode_stream() yields the compressed bytes for each chunk of
+    # input (see as_bytes), and decode_stream() the decoded bytes for
+    # each chunk of compressed input; chunks may split a code.  Memory
+    # use is bounded by the dictionary and the chunk size, not the
+    # length of the input.
+    CLEAR = 256
+    EOI = 257
+    CHECK_BYTES = 10000
+
+    def encode_stream(self, chunks):
+        word_size = self.word_size
+        if not 9 <= word_size <= 24:
+            raise ValueError("word_size must be between 9 and 24")
+        CLEAR, EOI = self.CLEAR, self.EOI
+        last_code = 2**word_size-1
+        table = {}
+        get = table.get
+        next_code = 258
+        width = 9
+        acc = 0          # bits not yet written, in the low n_acc bits
+        n_acc = 0
+        code = None
+        in_bytes = 0     # since the last CLEAR
+        out_bits = 0
+        checked_bytes = 0  # in_bytes and out_bits at the last check
+        checked_bits = 0
+        best_ratio = 0
+        yield bytes((word_size,))
+        for chunk in chunks:
+            data = memoryview(as_bytes(chunk))
+            output = bytearray()
+            start = 0
+            while start < len(data):
+                # Pieces end at multiples of CHECK_BYTES since the last
+                # CLEAR, whatever the chunk sizes.
+                piece = data[start:start + self.CHECK_BYTES - in_bytes % self.CHECK_BYTES]
+                start += len(piece)
+                in_bytes += len(piece)
+                if code is None:
+                    code = piece[0]
+                    piece = piece[1:]
+                for byte in piece:
+                    key = code << 8 | byte
+                    extended = get(key)
+                    if extended is not None:
+                        code = extended
+                        continue
+                    acc = acc << width | code
+                    n_acc += width
+                    out_bits += width
+                    if n_acc >= 64:
+                        n = n_acc >> 3
+                        n_acc &= 7
+                        output += (acc >> n_acc).to_bytes(n, 'big')
+                        acc &= (1 << n_acc) - 1
+                    if next_code <= last_code:
+                        table[key] = next_code
+                        if next_code == 1 << width:
+                            width += 1
+                        next_code += 1
+                    code = byte
+
+                if next_code > last_code and in_bytes % self.CHECK_BYTES == 0:
+                    ratio = 8*in_bytes / max(out_bits, 1)
+                    expanding = 8*(in_bytes - checked_bytes) < out_bits - checked_bits
+                    checked_bytes, checked_bits = in_bytes, out_bits
+                    if ratio >= best_ratio and not expanding:
+                        best_ratio = ratio
+                    else:
+                        # The dictionary is full, so writing the pending
+                        # code does not change the width.
+                        acc = (acc << width | code) << width | CLEAR
+                        n_acc += 2*width
+                        table.clear()
+                        next_code = 258
+                        width = 9
+                        code = None
+                        in_bytes = out_bits = 0
+                        checked_bytes = checked_bits = 0
+                        best_ratio = 0
+
+            n = n_acc >> 3
+            n_acc &= 7
+            output += (acc >> n_acc).to_bytes(n, 'big')
+            acc &= (1 << n_acc) - 1
+            yield bytes(output)
+
+        if code is not None:
+            acc = acc << width | code
+            n_acc += width
+            # The decoder adds an entry when it reads this code, which
+            # may widen EOI.
+            if next_code <= last_code and next_code == 1 << width:
+                width += 1
+        acc = acc << width | EOI
+        n_acc += width
+        n = (n_acc + 7) >> 3
+        yield (acc << (n*8 - n_acc)).to_bytes(n, 'big')
+
+    def decode_stream(self, chunks):
+        CLEAR, EOI = self.CLEAR, self.EOI
+        word_size = None
+        acc = 0
+        n_acc = 0
+        prev = None
+        done = False
+        for chunk in chunks:
+            data = memoryview(bytes(chunk))
+            if word_size is None and len(data):
+                word_size = data[0]
+                data = data[1:]
+                if not 9 <= word_size <= 24:
+                    raise ValueError("word_size must be between 9 and 24")
+                last_code = 2**word_size-1
+                table = [bytes((i,)) for i in range(256)] + [None] * (last_code + 1 - 256)
+                next_code = 258
+                width = 9
+            if done:
+                continue
+            output = bytearray()
+            for byte in data:
+                acc = acc << 8 | byte
+                n_acc += 8
+                if n_acc < width:
+                    continue
+                n_acc -= width
+                code = acc >> n_acc
+                acc &= (1 << n_acc) - 1
+
+                if code == CLEAR:
+                    next_code = 258
+                    width = 9
+                    prev = None
+                    continue
+                if code == EOI:
+                    done = True
+                    break
+                if prev is None:
+                    if code >= 256:
+                        raise ValueError("invalid code %d" % code)
+                    entry = table[code]
+                else:
+                    if code < next_code:
+                        entry = table[code]
+                    elif code == next_code and next_code <= last_code:
+                        entry = prev + prev[:1]
+                    else:
+                        raise ValueError("invalid code %d" % code)
+                    if next_code <= last_code:
+                        table[next_code] = prev + entry[:1]
+                        next_code += 1
+                        if next_code == 1 << width and width < word_size:
+                            width += 1
+                output += entry
+                prev = entry
+            yield bytes(output)
+        if word_size is not None and not done:
+            raise ValueError("compressed stream ends without EOI")
+
+    # Compresses (or decompresses) the file src into dst, chunk_bytes
+    # at a time.
+    def encode_file(self, src, dst, chunk_bytes=1<<20):
+        with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+            for data in self.encode_stream(iter_chunks(fin, chunk_bytes)):
+                fout.write(data)
+
+    def decode_file(self, src, dst, chunk_bytes=1<<20):
+        with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+            for data in self.decode_stream(iter_chunks(fin, chunk_bytes)):
+                fout.write(data)
+
+    # Block container for parallel and random-access use: the input is
+    # cut into blocks of block_size bytes, each compressed on its own
+    # (with encode_stream) in a process pool, so blocks can also be
+    # decompressed independently.  Layout:
+    #
+    #   header   CONTAINER_HEADER: magic, word_size, block_size
+    #   blocks   the compressed blocks, one after another
+    #   index    one INDEX_ENTRY per block: its offset in the file, its
+    #            compressed length and its uncompressed length
+    #   trailer  CONTAINER_TRAILER: offset of the index, number of
+    #            blocks
+    #
+    # Blocks are handed to the pool a batch of a few per process at a
+    # time, so memory use stays bounded by the batch, not the file.
+    def encode_container(self, src, dst, block_size=1<<22, processes=None):
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        index = []
+        with open(src, 'rb') as fin, open(dst, 'wb') as fout, multiprocessing.Pool(processes) as pool:
+            fout.write(CONTAINER_HEADER.pack(CONTAINER_MAGIC, self.word_size, block_size))
+            batch = []
+            for block in iter_chunks(fin, block_size):
+                batch.append((self.word_size, block))
+                if len(batch) == 2*processes:
+                    self.write_blocks(pool, batch, fout, index)
+                    batch = []
+            self.write_blocks(pool, batch, fout, index)
+            index_offset = fout.tell()
+            for entry in index:
+                fout.write(INDEX_ENTRY.pack(*entry))
+            fout.write(CONTAINER_TRAILER.pack(index_offset, len(index)))
+
+    @staticmethod
+    def write_blocks(pool, batch, fout, index):
+        for (word_size, block), data in zip(batch, pool.map(_encode_block, batch)):
+            index.append((fout.tell(), len(data), len(block)))
+            fout.write(data)
+
+    def decode_container(self, src, dst, processes=None):
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        index = read_container_index(src)[1]
+        with open(src, 'rb') as fin, open(dst, 'wb') as fout, multiprocessing.Pool(processes) as pool:
+            for start in range(0, len(index), 2*processes):
+                batch = []
+                for offset, length, raw_length in index[start:start + 2*processes]:
+                    fin.seek(offset)
+                    batch.append(fin.read(length))
+                for data in pool.map(_decode_block, batch):
+                    fout.write(data)
+
+    # Bytes start to stop of the original input of container src,
+    # decompressing only the blocks that overlap them.
+    def read_range(self, src, start, stop):
+        if start < 0:
+            raise ValueError("start must not be negative")
+        if start >= stop:
+            return b''
+        (magic, word_size, block_size), index = read_container_index(src)
+        output = bytearray()
+        with open(src, 'rb') as fin:
+            for b in range(start // block_size, min(-(-stop // block_size), len(index))):
+                offset, length, raw_length = index[b]
+                fin.seek(offset)
+                data = _decode_block(fin.read(length))
+                block_start = b * block_size
+                output += data[max(start - block_start, 0):stop - block_start]
+        return bytes(output)
+
+
+CONTAINER_MAGIC = b'LZWC'
+CONTAINER_HEADER = struct.Struct('>4sBI')
+INDEX_ENTRY = struct.Struct('>QQI')
+CONTAINER_TRAILER = struct.Struct('>QI')
+
+# Returns the header fields (magic, word_size, block_size) and the
+# index entries (offset, compressed length, uncompressed length) of
+# container src.
+def read_container_index(src):
+    with open(src, 'rb') as f:
+        header = CONTAINER_HEADER.unpack(f.read(CONTAINER_HEADER.size))
+        if header[0] != CONTAINER_MAGIC:
+            raise ValueError("%s is not an LZW block container" % src)
+        f.seek(-CONTAINER_TRAILER.size, 2)
+        index_offset, n_blocks = CONTAINER_TRAILER.unpack(f.read(CONTAINER_TRAILER.size))
+        f.seek(index_offset)
+        data = f.read(n_blocks * INDEX_ENTRY.size)
+    return header, list(INDEX_ENTRY.iter_unpack(data))
+
+def is_container(src):
+    with open(src, 'rb') as f:
+        return f.read(len(CONTAINER_MAGIC)) == CONTAINER_MAGIC
+
+# Pool workers for the block container.
+def _encode_block(job):
+    word_size, block = job
+    return b''.join(LZW(word_size).encode_stream([block]))
+
+def _decode_block(data):
+    return b''.join(LZW().decode_stream([data]))
+
+
+# message as bytes: str (and lists of one-character strings, as the
+# command line used to pass) are taken one character per byte.
+def as_bytes(message):
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        return message
+    if not isinstance(message, str):
+        message = ''.join(message)
+    return message.encode('latin-1')
+
+def iter_chunks(f, chunk_bytes):
+    while True:
+        data = f.read(chunk_bytes)
+        if not data:
+            return
+        yield data
+
+# Compressible test data: words drawn at random (Zipf-like) from a
+# fixed vocabulary, separated by spaces.
+def benchmark_data(n_bytes, seed=0):
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('etaoinshrdlu') for i in range(rng.randint(2, 9))) for j in range(2000)]
+    weights = [1.0/(rank+1) for rank in range(len(vocabulary))]
+    words = rng.choices(vocabulary, weights, k=n_bytes//4 + 1)
+    return ' '.join(words).encode('ascii')[:n_bytes]
+
+# Times encode_codes() on benchmark_data of each size, and returns
+# (size, seconds, MB/s) per size.
+def benchmark(sizes, seed=0):
+    lzw = LZW()
+    results = []
+    for n in sizes:
+        data = benchmark_data(n, seed)
+        start = time.perf_counter()
+        lzw.encode_codes(data)
+        elapsed = time.perf_counter() - start
+        results.append((n, elapsed, n / elapsed / 1e6))
+    return results
 
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('-f', '--filename', type=str, help='filename to compress or decompress', required=True)
+    parser.add_argument('-f', '--filename', type=str, help='filename to compress or decompress')
     parser.add_argument('-d', '--decompress', help='decompress file', action='store_true')
+    parser.add_argument('--benchmark', type=int, nargs='+', metavar='BYTES', help='time compression of synthetic inputs of these sizes')
+    parser.add_argument('-b', '--block-size', type=int, help='compress into a block container with blocks of this many bytes')
+    parser.add_argument('-p', '--processes', type=int, help='worker processes for block containers')
+    parser.add_argument('-r', '--range', type=int, nargs=2, metavar=('START', 'STOP'), help='extract bytes START to STOP of a block container')
     args = parser.parse_args()
 
     lzw = LZW()
 
-    if not args.decompress:
-        # read in the file
-        f = open(args.filename, 'rb')
-        compressed = [chr(k) for k in array.array("B", f.read())]
-        f.close()
-        # encode and output
-        x = lzw.encode(compressed)
+    if args.benchmark:
+        for n, elapsed, rate in benchmark(args.benchmark):
+            print("%11d bytes: %.3f s, %.2f MB/s" % (n, elapsed, rate))
+
+    elif args.filename is None:
+        parser.error('-f/--filename is required')
+
+    elif args.range:
+        sys.stdout.buffer.write(lzw.read_range(args.filename, *args.range))
+
+    elif not args.decompress:
         new_filename = args.filename + '.encoded'
-        x.write_to_file(new_filename)
+        if args.block_size:
+            lzw.encode_container(args.filename, new_filename, args.block_size, args.processes)
+        else:
+            lzw.encode_file(args.filename, new_filename)
         print("Saved encoded file as %s" % new_filename)
 
     else:
-        b = BitString()
-        b.read_in_file(args.filename)
-        x = lzw.decode(b)
         new_filename = args.filename + '.decoded'
-        with open(new_filename, "w") as f:
-            f.write(x)
+        if is_container(args.filename):
+            lzw.decode_container(args.filename, new_filename, args.processes)
+        else:
+            lzw.decode_file(args.filename, new_filename)
         print("Saved decoded file as %s" % new_filename)
@@ -1,45 +1,153 @@
-import numpy
+import argparse
+import functools
+import multiprocessing
+import time
 
-from collections import defaultdict
+import numpy
 
 from channel import ChannelEncoder, ChannelDecoder
 
+# Puncturing patterns for a rate-1/2 mother code.  A pattern is an
+# (r, P) 0/1 array: parity bit j of the i-th message bit is sent only
+# if pattern[j, i % P] is 1.
+PUNCTURE_PATTERNS = {
+    '2/3': numpy.array([[1, 1], [1, 0]]),
+    '3/4': numpy.array([[1, 1, 0], [1, 0, 1]]),
+}
+
+# Flat boolean mask, in transmission order, of the parity bits kept by
+# pattern over n_steps message bits.
+def puncture_mask(pattern, n_steps):
+    pattern = numpy.asarray(pattern, dtype=bool)
+    return pattern[:, numpy.arange(n_steps) % pattern.shape[1]].T.ravel()
+
+# Undoes puncturing on the receive side: returns the full-rate stream
+# with NaN (an erasure) in every position that was not sent.
+def depuncture(received_voltages, pattern):
+    received_voltages = numpy.asarray(received_voltages, dtype=float)
+    pattern = numpy.asarray(pattern, dtype=bool)
+    r, P = pattern.shape
+    # Number of message bits whose kept parity bits fit in the input.
+    kept = numpy.cumsum(pattern.sum(axis=0))
+    n_periods, extra = divmod(len(received_voltages), kept[-1])
+    n_steps = n_periods*P + numpy.searchsorted(kept, extra, side='right')
+    mask = puncture_mask(pattern, n_steps)
+    result = numpy.full(n_steps*r, numpy.nan)
+    result[mask] = received_voltages[:mask.sum()]
+    return result
+
+# Shared, read-only description of the trellis of the code with
+# generator matrix G.  Build one with get_trellis(G) rather than
+# directly, so that encoders and decoders for the same G share it.
+#
+# States are (K-1)-bit integers holding the most recent message bits,
+# newest in the high position; a register value x is a K-bit integer
+# holding x[n], x[n-1], ..., x[n-K+1], newest first.
+class Trellis:
+
+    def __init__(self, G):
+        G = numpy.asarray(G)
+        self.r, self.K = G.shape
+        self.n_states = 2**(self.K-1)
+        states = numpy.arange(self.n_states)
+
+        # output_table[x] = the r parity bits for register value x, and
+        # output_symbol[x] the same bits as an integer (first parity
+        # bit in the high position).
+        registers = numpy.arange(2**self.K)
+        windows = (registers[:, numpy.newaxis] >> numpy.arange(self.K-1, -1, -1)) & 1
+        self.output_table = (windows.dot(G.T) % 2).astype(numpy.uint8)
+        self.output_symbol = self.output_table.dot(1 << numpy.arange(self.r-1, -1, -1))
+
+        # parity_patterns[c] = the r bits of output symbol c.
+        self.parity_patterns = (numpy.arange(2**self.r)[:, numpy.newaxis] >> numpy.arange(self.r-1, -1, -1)) & 1
+
+        # next_state[s, b] = the state after s on message bit b.
+        self.next_state = (numpy.arange(2)[numpy.newaxis, :] << (self.K-2)) | (states[:, numpy.newaxis] >> 1)
+
+        # predecessors[s] = the two states with edges into s, and
+        # edge_symbol[s, j] = the output symbol on the edge from
+        # predecessors[s, j] into s.
+        self.predecessors = numpy.stack(((2*states) % self.n_states, (2*states+1) % self.n_states), axis=1)
+        self.edge_symbol = self.output_symbol[((states[:, numpy.newaxis] >> (self.K-2)) << (self.K-1)) | self.predecessors]
+
+        for array in (self.output_table, self.output_symbol, self.parity_patterns,
+                      self.next_state, self.predecessors, self.edge_symbol):
+            array.setflags(write=False)
+
+        # predecessors as nested tuples, for scalar lookups in
+        # tracebacks.
+        self.predecessor_states = tuple(tuple(int(p) for p in row) for row in self.predecessors)
+
+@functools.lru_cache(maxsize=32)
+def _cached_trellis(shape, data):
+    return Trellis(numpy.frombuffer(data, dtype=numpy.uint8).reshape(shape))
+
+def get_trellis(G):
+    G = numpy.ascontiguousarray(G, dtype=numpy.uint8) % 2
+    return _cached_trellis(G.shape, G.tobytes())
+
 class ConvolutionalEncoder(ChannelEncoder):
 
     def __init__(self, G):
         super(ChannelEncoder, self).__init__()
         self.G = G
         self.r, self.K = G.shape
-    def multiplier(self,i, received_voltages):
-        window = []
-        if i<=self.K-2:
-            window =[ 0 for j in range(self.K-i-1)] + received_voltages[0:i+1]
-            window.reverse()
-            window = numpy.array(window)
-            tr = numpy.matmul(self.G,window)
-            modu = lambda t: t%2
-            vfunc = numpy.vectorize(modu)
-            temp_result_array = vfunc(tr)
-            tr = list(temp_result_array)
-        
-        else:
-            window = received_voltages[i-self.K+1:i+1]
-            window.reverse()
-            window = numpy.array(window)
-            tr = numpy.matmul(self.G, window)
-            modu = lambda t: t%2
-            vfunc = numpy.vectorize(modu)
-            temp_result_array = vfunc(tr)
-            tr = list(temp_result_array)
-        return tr
-
-    def encode(self, received_voltages):
-        N = len(received_voltages)
-        result = []
-        for i in range(N):
-           result+= self.multiplier(i, received_voltages)
+
+        # The shift register is kept as an integer of K-1 bits, most
+        # recent bit in the high position -- the same convention the
+        # ViterbiDecoder uses for its states.
+        self.state = 0
+
+        # self.output_table[x] = the r parity bits produced when the
+        # window x[n], x[n-1], ..., x[n-K+1] (most recent bit first)
+        # is the binary representation of x.
+        self.trellis = get_trellis(G)
+        self.output_table = self.trellis.output_table
+
+    def reset(self):
+        self.state = 0
+
+    # Encodes bits through the shift register, carrying self.state
+    # over from the previous call, so a message can be fed in pieces.
+    # The register contents at every step are formed at once from the
+    # previous state and the new bits, then looked up in
+    # self.output_table.  Returns the r parity bits per input bit as a
+    # flat numpy array.
+    def encode_chunk(self, bits):
+        bits = numpy.asarray(bits, dtype=numpy.int64)
+        N = len(bits)
+        if N == 0:
+            return numpy.zeros(0, dtype=numpy.uint8)
+        # Oldest bit of the register first.
+        history = numpy.array([(self.state >> j) & 1 for j in range(self.K-1)], dtype=numpy.int64)
+        extended = numpy.concatenate((history, bits))
+        x = numpy.zeros(N, dtype=numpy.int64)
+        for j in range(self.K):
+            x |= extended[self.K-1-j:self.K-1-j+N] << (self.K-1-j)
+        self.state = int(x[-1] >> 1)
+        return self.output_table[x].ravel()
+
+    # Encodes a whole message, starting from the all-zeros state.
+    # Parity stream j is the GF(2) convolution of the message with
+    # G[j], so all streams are computed at once and then interleaved.
+    # If puncture is given (see PUNCTURE_PATTERNS), only the parity
+    # bits it selects are sent.
+    def encode(self, received_voltages, puncture=None):
+        bits = numpy.asarray(received_voltages, dtype=numpy.uint8)
+        N = len(bits)
+        result = numpy.empty((N, self.r), dtype=numpy.uint8)
+        for j in range(self.r):
+            result[:, j] = numpy.convolve(bits, numpy.asarray(self.G[j], dtype=numpy.uint8))[:N] & 1
+        result = result.ravel()
+        if puncture is not None:
+            result = result[puncture_mask(puncture, N)]
         return result
 
+# Number of quantization levels for the quantized soft-decision
+# branch metrics (see ViterbiDecoder.symbol_metrics).
+QUANTIZATION_LEVELS = {'soft3': 8, 'soft4': 16}
+
 class ViterbiDecoder(ChannelDecoder):
 
     def __init__(self, G):
@@ -53,23 +161,37 @@ class ViterbiDecoder(ChannelDecoder):
         # For instance, the state "10" would be kept as "2", "11" as
         # 3, etc.
 
+        # The trellis arrays are shared by every encoder and decoder
+        # for the same G (see Trellis).
+        self.trellis = get_trellis(G)
+
         # self.predecessor_states[s] = (s1, s2), where s1 and s2 are
         # the two predecessor states for state s (i.e., the two states
-        # that have edges into s in the trellis).
-        self.predecessor_states = [((2*s+0) % self.n_states, (2*s+1) % self.n_states) for s in self.states]
-
-        # self.expected_parity[s1][s2] = the parity when transitioning
-        # from s1 to s2 ('None' if there is no transition from s1 to
-        # s2).  This is set up as a dictionary in init, for
-        # efficiency.  For inefficiency, you could call
-        # calculate_expected_parity() each time.
-        self.expected_parity = defaultdict(lambda:defaultdict(float))
-        for (s1, s2) in [(s1, s2) for s1 in self.states for s2 in self.states]:
-            self.expected_parity[s1][s2] = self.calculate_expected_parity(s1, s2) if s1 in self.predecessor_states[s2] else None
-
-        
+        # that have edges into s in the trellis).  self.predecessors is
+        # the same as an (n_states, 2) index array, so that a whole
+        # trellis column can be updated with one fancy-indexing
+        # operation.
+        self.predecessor_states = self.trellis.predecessor_states
+        self.predecessors = self.trellis.predecessors
+
+        # There are only 2**r distinct parity patterns.
+        # self.parity_patterns[c] is pattern c (first parity bit in
+        # the high position), and self.edge_symbol[s, j] is the
+        # pattern on the edge from self.predecessors[s, j] into s.
+        # Branch metrics are computed once per pattern and then
+        # gathered onto the edges.
+        self.parity_patterns = self.trellis.parity_patterns
+        self.edge_symbol = self.trellis.edge_symbol
+
+        # Survivors are stored as one decision bit per state per time
+        # step (0: the path came from predecessors[s, 0], 1: from
+        # predecessors[s, 1]), packed into n_words uint64 words.
+        self.n_words = (self.n_states + 63) // 64
+
+        # self.PM is the current column of path metrics, and
+        # self.decisions[n-1] the packed decisions of time step n.
         self.PM = None
-        self.Predecessor = None
+        self.decisions = None
 
     def calculate_expected_parity(self, from_state, to_state):
 
@@ -91,19 +213,99 @@ class ViterbiDecoder(ChannelDecoder):
     def int_to_bit_array(i, length):
         return numpy.array([int(q) for q in (length-len(bin(i)[2:]))*'0'+bin(i)[2:]])
 
-    def viterbi_step(self, n, received_voltages):
-        for s in self.states:
-            (s1, s2) = self.predecessor_states[s]
-            expected1 = self.expected_parity[s1][s]
-            expected2 = self.expected_parity[s2][s]
-            bm1 = self.branch_metric(expected1, received_voltages)
-            bm2 = self.branch_metric(expected2,received_voltages)
-            if self.PM[s1,n-1]+bm1 < self.PM[s2,n-1]+bm2:
-                self.PM[s,n] = self.PM[s1,n-1]+bm1
-                self.Predecessor[s,n]=s1
-            else:
-                self.PM[s,n] = self.PM[s2,n-1]+bm2
-                self.Predecessor[s,n]=s2
+    # Add-compare-select for every state at once.  Given the path
+    # metrics pm of the previous column and the metric of every parity
+    # pattern for this time step (see symbol_metrics), returns the new
+    # column of path metrics and the decision bit of every state.  pm
+    # may have leading batch dimensions (one row per frame), in which
+    # case metrics carries the same leading dimensions.
+    #
+    # The new column is renormalized by subtracting its minimum.  This
+    # does not change any comparison, and keeps the metrics within a
+    # few constraint lengths' worth of branch metrics however long the
+    # stream, so they fit in a small integer type.
+    def acs(self, pm, metrics):
+        # candidates[..., s, j] is the metric of reaching s through
+        # self.predecessors[s, j].
+        candidates = pm[..., self.predecessors] + metrics[..., self.edge_symbol]
+        # Ties go to the second predecessor.
+        choice = candidates[..., 0] >= candidates[..., 1]
+        new_pm = numpy.where(choice, candidates[..., 1], candidates[..., 0])
+        new_pm -= new_pm.min(axis=-1, keepdims=True)
+        return new_pm, choice
+
+    def viterbi_step(self, n, received_voltages, metric='hard'):
+        metrics = self.symbol_metrics(received_voltages, metric).astype(self.PM.dtype)
+        self.PM, choice = self.acs(self.PM, metrics)
+        self.decisions[n-1] = self.pack_decisions(choice)
+
+    # Packs (..., n_states) decision bits into (..., n_words) uint64
+    # words, state s being bit s % 64 of word s // 64.
+    def pack_decisions(self, choice):
+        packed = numpy.packbits(choice, axis=-1, bitorder='little')
+        words = numpy.zeros(choice.shape[:-1] + (self.n_words*8,), dtype=numpy.uint8)
+        words[..., :packed.shape[-1]] = packed
+        return words.view('<u8')
+
+    # Returns the path metrics at time 0 (with optional leading batch
+    # dimensions) for the given metric: the starting state is the most
+    # likely, the other states are "infinitely" worse.  Hard and
+    # quantized metrics are small integers, so path metrics are kept
+    # in int16 (int32 for codes too large for that) and "infinity"
+    # only has to exceed any metric reachable in K steps.  Soft metrics
+    # stay in float64.  If start_state is None, the starting state is
+    # unknown and all states start out equally likely.
+    def initial_metrics(self, metric='hard', shape=(), start_state=0):
+        if metric == 'soft':
+            dtype, infinity = numpy.float64, 1000000
+        else:
+            max_branch = self.r * (QUANTIZATION_LEVELS.get(metric, 2) - 1)
+            infinity = self.K * max_branch
+            dtype = numpy.int16 if (2*self.K+1)*max_branch < 2**15 else numpy.int32
+        if start_state is None:
+            return numpy.zeros(shape + (self.n_states,), dtype=dtype)
+        pm = numpy.full(shape + (self.n_states,), infinity, dtype=dtype)
+        pm[..., start_state] = 0
+        return pm
+
+    # Branch metrics for every time step at once.  received has shape
+    # (..., r), one row of r voltages per time step; the result has
+    # shape (..., 2**r) and holds the metric of each parity pattern in
+    # self.parity_patterns.  The voltages are thresholded or quantized
+    # once per time step, not once per edge.  NaN voltages are
+    # erasures (e.g. punctured bits) and add nothing to any metric.
+    # metric is one of:
+    #
+    #   'hard'   Hamming distance between the thresholded voltages
+    #            (> 0.5 is a 1) and the pattern.
+    #   'soft'   Squared Euclidean distance between the voltages and
+    #            the pattern.
+    #   'soft3', 'soft4'
+    #            The voltages are quantized to 3 or 4 bits (0 maps to
+    #            level 0, 1 to the top level) and the metric is the
+    #            integer distance between the levels and the pattern.
+    def symbol_metrics(self, received, metric='hard'):
+        received = numpy.asarray(received, dtype=float)[..., numpy.newaxis, :]
+        erased = numpy.isnan(received)
+        if erased.any():
+            received = numpy.where(erased, 0, received)
+        else:
+            erased = None
+
+        if metric == 'hard':
+            distance = (received > 0.5) != self.parity_patterns
+        elif metric == 'soft':
+            distance = (received - self.parity_patterns)**2
+        elif metric in QUANTIZATION_LEVELS:
+            top = QUANTIZATION_LEVELS[metric] - 1
+            levels = numpy.clip(numpy.rint(received*top), 0, top).astype(int)
+            distance = numpy.abs(levels - self.parity_patterns*top)
+        else:
+            raise ValueError("unknown branch metric %r" % (metric,))
+
+        if erased is not None:
+            distance = numpy.where(erased, 0, distance)
+        return distance.sum(axis=-1)
 
     def branch_metric(self, expected, received, soft_decoding=False):
         l = len(expected)
@@ -126,54 +328,243 @@ class ViterbiDecoder(ChannelDecoder):
                 sum+= (received[i]-expected[i])**2
             return sum
 
-    def most_likely_state(self, n):
-        best_state = list(self.states)[0]
-        for s in self.states:
-            if self.PM[s,n]<self.PM[best_state,n]:
-                best_state = s
-        return best_state
+    def most_likely_state(self):
+        # argmin returns the first minimum, i.e. the lowest-numbered
+        # state on ties.
+        return int(numpy.argmin(self.PM))
+
     def traceback(self,s,n):
-        result = []
-        for i in range(n,0,-1):
-            prev_state = self.Predecessor[s,i]
-            # extracting bits from integers
-            temp = prev_state >> 1
-            if temp==s:
-                result.append(0)
-            else:
-                result.append(1)
-            s = prev_state
-        result.reverse()
-        result = numpy.array(result)
+        return self.survivor_bits(self.decisions[:n], s)
+
+    # Walks the survivor path ending in state s backwards through the
+    # given rows of packed decisions and returns one message bit per
+    # row.
+    def survivor_bits(self, decisions, s):
+        result = numpy.zeros(len(decisions), dtype=int)
+        for i in range(len(decisions)-1,-1,-1):
+            # The newest message bit is the high bit of the state.
+            result[i] = s >> (self.K-2)
+            d = (int(decisions[i, s >> 6]) >> (s & 63)) & 1
+            s = self.predecessor_states[s][d]
         return result
-        
-    def decode(self, received_voltages):
 
-        max_n = (len(received_voltages) // self.r) + 1
+    # Number of time steps whose branch metrics are computed together.
+    # Bounds the size of the temporary metric arrays on long inputs.
+    BLOCK_STEPS = 4096
 
-        # self.PM is the trellis itself; rows are states, columns are
-        # time.  self.PM[s,n] is the metric for the most-likely path
-        # through the trellis arriving at state s at time n.
-        self.PM = numpy.zeros((self.n_states, max_n))
+    # received_voltages may contain NaN erasures.  If puncture is
+    # given, received_voltages is the punctured stream and is
+    # depunctured (see depuncture) before decoding.
+    def decode(self, received_voltages, metric='hard', start_state=0, puncture=None):
 
-        # at time 0, the starting state is the most likely, the other
-        # states are "infinitely" worse.
-        self.PM[1:self.n_states,0] = 1000000
+        if puncture is not None:
+            received_voltages = depuncture(received_voltages, puncture)
+        received_voltages = numpy.asarray(received_voltages, dtype=float)
+        n_steps = len(received_voltages) // self.r
 
-        # self.Predecessor[s,n] = predecessor state for s at time n.
-        self.Predecessor = numpy.zeros((self.n_states,max_n), dtype=numpy.int)
+        self.PM = self.initial_metrics(metric, start_state=start_state)
+        self.decisions = numpy.zeros((n_steps, self.n_words), dtype=numpy.uint64)
 
-        # Viterbi Algorithm:
-        n = 0
-        for i in range(0, len(received_voltages), self.r):
-            n += 1
-            # Fill in the next columns of PM, Predecessor based
-            # on info in the next r incoming parity bits
-            self.viterbi_step(n, received_voltages[i:i+self.r])
+        # Viterbi Algorithm: fill in the next columns of decisions
+        # based on info in the next r incoming parity bits.
+        for start in range(0, n_steps, self.BLOCK_STEPS):
+            stop = min(start + self.BLOCK_STEPS, n_steps)
+            block = received_voltages[start*self.r:stop*self.r].reshape(-1, self.r)
+            metrics = self.symbol_metrics(block, metric).astype(self.PM.dtype)
+            for n in range(start, stop):
+                self.PM, choice = self.acs(self.PM, metrics[n-start])
+                self.decisions[n] = self.pack_decisions(choice)
 
         # Find the most-likely ending state, and traceback to
         # reconstruct the message.
-        s = self.most_likely_state(n)
-        result = self.traceback(s,n)
+        s = self.most_likely_state()
+        result = self.traceback(s,n_steps)
         return result
 
+    # Decodes many equal-length frames at once.  frames is an
+    # (n_frames, frame_len) array of voltages; the result is an
+    # (n_frames, frame_len/r) array of bits, row i being what
+    # decode(frames[i]) would return.  self.PM and self.decisions gain
+    # a leading frame dimension, so each trellis step is a single
+    # vectorized update over every frame and state.
+    def decode_batch(self, frames, metric='hard', puncture=None):
+        frames = numpy.asarray(frames, dtype=float)
+        if puncture is not None:
+            frames = numpy.array([depuncture(f, puncture) for f in frames]).reshape(len(frames), -1)
+        n_frames, frame_len = frames.shape
+        n_steps = frame_len // self.r
+        metrics = self.symbol_metrics(frames[:, :n_steps*self.r].reshape(n_frames, -1, self.r), metric)
+
+        self.PM = self.initial_metrics(metric, (n_frames,))
+        metrics = metrics.astype(self.PM.dtype)
+        self.decisions = numpy.zeros((n_frames, n_steps, self.n_words), dtype=numpy.uint64)
+        for n in range(n_steps):
+            self.PM, choice = self.acs(self.PM, metrics[:, n])
+            self.decisions[:, n] = self.pack_decisions(choice)
+
+        # Trace every frame back in lockstep.
+        rows = numpy.arange(n_frames)
+        s = numpy.argmin(self.PM, axis=1)
+        result = numpy.zeros((n_frames, n_steps), dtype=int)
+        for i in range(n_steps-1, -1, -1):
+            result[:, i] = s >> (self.K-2)
+            words = self.decisions[rows, i, s >> 6]
+            d = (words >> (s & 63).astype(numpy.uint64)) & numpy.uint64(1)
+            s = self.predecessors[s, d.astype(int)]
+        return result
+
+    # Streaming decoder with a truncated traceback.  chunks is an
+    # iterable of voltage arrays of any length; decoded bits are
+    # yielded as numpy arrays as soon as they are depth steps behind
+    # the most recent input.  Only the current path metrics and at
+    # most 2*depth columns of decisions are kept, so memory does not
+    # grow with the length of the stream.
+    def decode_stream(self, chunks, depth=None, metric='hard'):
+        if depth is None:
+            depth = 5*self.K
+
+        pm = self.initial_metrics(metric)
+        survivors = numpy.zeros((2*depth, self.n_words), dtype=numpy.uint64)
+        filled = 0
+        pending = numpy.zeros(0)
+
+        for chunk in chunks:
+            pending = numpy.concatenate((pending, numpy.asarray(chunk, dtype=float)))
+            usable = len(pending) - len(pending) % self.r
+            metrics = self.symbol_metrics(pending[:usable].reshape(-1, self.r), metric).astype(pm.dtype)
+            for step_metrics in metrics:
+                pm, choice = self.acs(pm, step_metrics)
+                survivors[filled] = self.pack_decisions(choice)
+                filled += 1
+                if filled == 2*depth:
+                    # Trace back from the current best state; the
+                    # oldest depth bits are now final.
+                    s = int(numpy.argmin(pm))
+                    yield self.survivor_bits(survivors, s)[:depth]
+                    survivors[:depth] = survivors[depth:]
+                    filled = depth
+            pending = pending[usable:]
+
+        # End of stream: flush everything from the best final state,
+        # exactly as decode() would.
+        if filled:
+            s = int(numpy.argmin(pm))
+            yield self.survivor_bits(survivors[:filled], s)
+
+    # Decodes one long stream on several processes.  The stream is cut
+    # into segments of segment_steps time steps, and each segment is
+    # decoded in a process pool together with margin extra steps on
+    # either side: the leading margin lets the path metrics warm up
+    # from an unknown starting state, the trailing one lets the
+    # survivor paths merge before the segment's bits are read off.
+    # With the default margin of 10*K steps the result matches
+    # decode() except at very high error rates.
+    def decode_parallel(self, received_voltages, metric='hard', processes=None, segment_steps=None, margin=None, puncture=None):
+        if puncture is not None:
+            received_voltages = depuncture(received_voltages, puncture)
+        received_voltages = numpy.asarray(received_voltages, dtype=float)
+        n_steps = len(received_voltages) // self.r
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if segment_steps is None:
+            segment_steps = max(-(-n_steps // processes), 1)
+        if margin is None:
+            margin = 10*self.K
+
+        jobs = []
+        for start in range(0, n_steps, segment_steps):
+            stop = min(start + segment_steps, n_steps)
+            first = max(start - margin, 0)
+            last = min(stop + margin, n_steps)
+            jobs.append((self.G, received_voltages[first*self.r:last*self.r], metric,
+                         0 if first == 0 else None, start - first, stop - first))
+
+        if not jobs:
+            return numpy.zeros(0, dtype=int)
+        with multiprocessing.Pool(processes) as pool:
+            segments = pool.map(_decode_segment, jobs)
+        return numpy.concatenate(segments)
+
+
+# Process-pool worker for ViterbiDecoder.decode_parallel: decodes one
+# segment with its margins and returns the bits of the segment proper.
+def _decode_segment(job):
+    G, received_voltages, metric, start_state, keep_from, keep_to = job
+    decoded = ViterbiDecoder(G).decode(received_voltages, metric, start_state)
+    return decoded[keep_from:keep_to]
+
+
+# Generator matrices (octal, newest bit first) of the usual rate-1/2
+# codes with constraint lengths 3 through 9.
+BENCHMARK_CODES = {
+    3: (0o7, 0o5),
+    4: (0o17, 0o15),
+    5: (0o35, 0o23),
+    6: (0o75, 0o53),
+    7: (0o171, 0o133),
+    8: (0o371, 0o247),
+    9: (0o753, 0o561),
+}
+
+def generator_matrix(K, octal_rows):
+    return numpy.array([ViterbiDecoder.int_to_bit_array(g, K) for g in octal_rows])
+
+# Decoded bits/sec for each constraint length, using decode_parallel
+# on the given number of processes if processes is set.
+def benchmark(n_bits, constraint_lengths, seed=0, processes=None):
+    rng = numpy.random.RandomState(seed)
+    results = []
+    for K in constraint_lengths:
+        G = generator_matrix(K, BENCHMARK_CODES[K])
+        message = rng.randint(0, 2, n_bits)
+        received = ConvolutionalEncoder(G).encode(message).astype(float)
+        decoder = ViterbiDecoder(G)
+        start = time.perf_counter()
+        if processes:
+            decoded = decoder.decode_parallel(received, processes=processes)
+        else:
+            decoded = decoder.decode(received)
+        elapsed = time.perf_counter() - start
+        assert numpy.array_equal(decoded, message)
+        results.append((K, n_bits / elapsed))
+    return results
+
+# Code rate vs. bit error rate vs. decoded bits/sec for the mother code
+# and each of PUNCTURE_PATTERNS, over an AWGN channel with the given
+# noise standard deviation (transmitted voltages are 0 and 1).
+def rate_benchmark(n_bits, constraint_lengths, noise, metric='soft', seed=0):
+    rng = numpy.random.RandomState(seed)
+    results = []
+    for K in constraint_lengths:
+        G = generator_matrix(K, BENCHMARK_CODES[K])
+        encoder = ConvolutionalEncoder(G)
+        decoder = ViterbiDecoder(G)
+        message = rng.randint(0, 2, n_bits)
+        for name in [None] + sorted(PUNCTURE_PATTERNS):
+            pattern = PUNCTURE_PATTERNS.get(name)
+            sent = encoder.encode(message, puncture=pattern)
+            received = sent + rng.normal(0, noise, len(sent))
+            start = time.perf_counter()
+            decoded = decoder.decode(received, metric, puncture=pattern)
+            elapsed = time.perf_counter() - start
+            ber = numpy.mean(decoded != message)
+            results.append((K, name or '1/%d' % encoder.r, ber, n_bits / elapsed))
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--bits', type=int, default=100000, help='message length in bits')
+    parser.add_argument('-K', '--constraint-lengths', type=int, nargs='+', default=sorted(BENCHMARK_CODES), help='constraint lengths to benchmark')
+    parser.add_argument('-p', '--processes', type=int, help='decode with decode_parallel on this many processes')
+    parser.add_argument('--noise', type=float, help='sweep punctured code rates over AWGN with this standard deviation')
+    parser.add_argument('--metric', default='soft', help='branch metric for the code rate sweep')
+    args = parser.parse_args()
+
+    if args.noise is not None:
+        for K, rate, ber, speed in rate_benchmark(args.bits, args.constraint_lengths, args.noise, args.metric):
+            print("K=%d rate=%s: BER %.2e, %.0f decoded bits/sec" % (K, rate, ber, speed))
+    else:
+        for K, rate in benchmark(args.bits, args.constraint_lengths, processes=args.processes):
+            print("K=%d: %.0f decoded bits/sec" % (K, rate))